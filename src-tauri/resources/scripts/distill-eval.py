@@ -14,7 +14,11 @@ Contract
 from __future__ import annotations
 
 import argparse
+import contextlib
+import functools
+import importlib.util
 import json
+import math
 import os
 import random
 import sqlite3
@@ -22,9 +26,12 @@ import sys
 import time
 import traceback
 import warnings
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from difflib import SequenceMatcher
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 warnings.filterwarnings(
     "ignore",
@@ -32,25 +39,58 @@ warnings.filterwarnings(
     message=r"The pynvml package is deprecated\..*",
 )
 
+# Optional C-backed fuzzy matcher; difflib remains the zero-dependency fallback.
+try:
+    from rapidfuzz import fuzz as _rapidfuzz  # type: ignore
+except Exception:
+    _rapidfuzz = None
+
+# Optional C JSON encoder (2-5x faster, emits bytes directly); stdlib json
+# remains the zero-dependency fallback.
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
+# Optional Aho-Corasick automaton for multi-pattern keyword/citation matching.
+try:
+    import ahocorasick  # type: ignore
+except Exception:
+    ahocorasick = None
+
+
+def _dumps_bytes(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=True).encode()
+
 
 def _jsonl(kind: str, payload: Dict[str, Any]) -> None:
-    sys.stdout.write(json.dumps({"kind": kind, "payload": payload}, ensure_ascii=True) + "\n")
-    sys.stdout.flush()
+    sys.stdout.buffer.write(_dumps_bytes({"kind": kind, "payload": payload}) + b"\n")
+    sys.stdout.buffer.flush()
 
 
-def _atomic_write_text(path: Path, text: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    tmp = path.with_suffix(path.suffix + f".tmp-{int(time.time()*1000)}")
-    tmp.write_text(text, encoding="utf-8")
-    os.replace(tmp, path)
+_progress_buf: List[bytes] = []
 
 
-def _atomic_write_jsonl(path: Path, rows: Iterable[Dict[str, Any]]) -> None:
+def _jsonl_buffered(kind: str, payload: Dict[str, Any], flush_every: int) -> None:
+    """Buffer an event and flush stdout only every `flush_every` events."""
+    _progress_buf.append(_dumps_bytes({"kind": kind, "payload": payload}) + b"\n")
+    if len(_progress_buf) >= max(1, flush_every):
+        _flush_buffered()
+
+
+def _flush_buffered() -> None:
+    if _progress_buf:
+        sys.stdout.buffer.write(b"".join(_progress_buf))
+        sys.stdout.buffer.flush()
+        _progress_buf.clear()
+
+
+def _atomic_write_text(path: Path, text: str) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     tmp = path.with_suffix(path.suffix + f".tmp-{int(time.time()*1000)}")
-    with tmp.open("w", encoding="utf-8") as f:
-        for row in rows:
-            f.write(json.dumps(row, ensure_ascii=True) + "\n")
+    tmp.write_text(text, encoding="utf-8")
     os.replace(tmp, path)
 
 
@@ -59,13 +99,12 @@ def _safe_exc() -> str:
 
 
 def _try_imports() -> Dict[str, bool]:
+    # find_spec only consults the module finders, so probing availability does
+    # not pay the multi-second import cost of torch/transformers up front.
     ok: Dict[str, bool] = {}
     for name in ["torch", "transformers", "peft", "pynvml", "psutil"]:
         try:
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                __import__(name)
-            ok[name] = True
+            ok[name] = importlib.util.find_spec(name) is not None
         except Exception:
             ok[name] = False
     return ok
@@ -109,6 +148,9 @@ class EvalConfig:
     max_new_tokens: int = 128
     temperature: float = 0.0
     top_p: float = 1.0
+    batch_size: int = 8
+    prompt_max_len: int = 1024
+    compile_model: bool = False
     seed: Optional[int] = None
     compute_teacher_agreement: bool = False
 
@@ -136,6 +178,8 @@ def _parse_config(raw: Dict[str, Any], run_dir_override: Optional[str]) -> EvalC
     max_new_tokens = int(raw.get("max_new_tokens") or raw.get("maxNewTokens") or 128)
     temperature = float(raw.get("temperature") or 0.0)
     top_p = float(raw.get("top_p") or raw.get("topP") or 1.0)
+    batch_size = int(raw.get("batch_size") or raw.get("batchSize") or 8)
+    prompt_max_len = int(raw.get("prompt_max_len") or raw.get("promptMaxLen") or 1024)
 
     seed_val = raw.get("seed")
     seed: Optional[int] = None
@@ -160,6 +204,9 @@ def _parse_config(raw: Dict[str, Any], run_dir_override: Optional[str]) -> EvalC
         max_new_tokens=max_new_tokens,
         temperature=temperature,
         top_p=top_p,
+        batch_size=batch_size,
+        prompt_max_len=prompt_max_len,
+        compile_model=bool(raw.get("compile") or raw.get("compile_model") or raw.get("compileModel") or False),
         seed=seed,
         compute_teacher_agreement=bool(
             raw.get("compute_teacher_agreement") or raw.get("computeTeacherAgreement") or False
@@ -171,7 +218,46 @@ def _parse_config(raw: Dict[str, Any], run_dir_override: Optional[str]) -> EvalC
 class EvalSample:
     prompt: str
     expected: str
-    metadata: Optional[Dict[str, Any]]
+    # Sample-invariant metric inputs, precomputed at load time so the hot
+    # loop does not re-normalize/lowercase them for every prediction.
+    expected_norm: str
+    keywords_lower: Tuple[str, ...]
+    citations_lower: Tuple[str, ...]
+
+
+@dataclass
+class SamplesSoA:
+    """Structure-of-arrays sample store: parallel lists give the metrics loop
+    linear access and make batch slicing for generation trivial."""
+
+    prompts: List[str]
+    expected: List[str]
+    expected_norm: List[str]
+    keywords_lower: List[Tuple[str, ...]]
+    citations_lower: List[Tuple[str, ...]]
+
+    def __len__(self) -> int:
+        return len(self.prompts)
+
+    def select(self, indices: List[int]) -> "SamplesSoA":
+        return SamplesSoA(
+            prompts=[self.prompts[i] for i in indices],
+            expected=[self.expected[i] for i in indices],
+            expected_norm=[self.expected_norm[i] for i in indices],
+            keywords_lower=[self.keywords_lower[i] for i in indices],
+            citations_lower=[self.citations_lower[i] for i in indices],
+        )
+
+
+def _build_samples_soa(items: Iterator[EvalSample]) -> SamplesSoA:
+    soa = SamplesSoA([], [], [], [], [])
+    for s in items:
+        soa.prompts.append(s.prompt)
+        soa.expected.append(s.expected)
+        soa.expected_norm.append(s.expected_norm)
+        soa.keywords_lower.append(s.keywords_lower)
+        soa.citations_lower.append(s.citations_lower)
+    return soa
 
 
 @dataclass(frozen=True)
@@ -191,6 +277,13 @@ class DbVersionInfo:
     parent_version_id: Optional[str]
 
 
+@dataclass(frozen=True)
+class DbEvalContext:
+    version: DbVersionInfo
+    run: Optional[DbRunInfo]
+    base_model_path: Optional[str]
+
+
 def _infer_training_db_path(run_dir: Path) -> Optional[Path]:
     for parent in [run_dir, *list(run_dir.parents)[:6]]:
         candidate = parent / "training.db"
@@ -199,119 +292,134 @@ def _infer_training_db_path(run_dir: Path) -> Optional[Path]:
     return None
 
 
-def _load_version_info(db_path: Path, version_id: str) -> DbVersionInfo:
-    conn = sqlite3.connect(str(db_path))
+@functools.lru_cache(maxsize=4)
+def _db_conn(db_path: str) -> sqlite3.Connection:
+    """Open (and cache) a read-mostly connection with performance pragmas applied."""
+    conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
+    # Best-effort: WAL needs write access to the database directory, and the
+    # evaluator may be pointed at a read-only file. Reads work without them.
     try:
-        row = conn.execute(
-            """
-            SELECT version_id, model_id, run_id, artifact_path, parent_version_id
-            FROM model_versions
-            WHERE version_id = ?
-            """,
-            (version_id,),
-        ).fetchone()
-        if not row:
-            raise ValueError(f"Model version not found: {version_id}")
-        return DbVersionInfo(
-            version_id=str(row["version_id"]),
-            model_id=str(row["model_id"]),
-            run_id=(str(row["run_id"]) if row["run_id"] is not None else None),
-            artifact_path=str(row["artifact_path"]),
-            parent_version_id=(
-                str(row["parent_version_id"]) if row["parent_version_id"] is not None else None
-            ),
-        )
-    finally:
-        conn.close()
-
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-32768")
+        conn.execute("PRAGMA busy_timeout=5000")
+    except sqlite3.Error:
+        pass
+    return conn
+
+
+def _load_eval_context(db_path: Path, version_id: str) -> DbEvalContext:
+    """Resolve version, run, and base-model artifact in one JOINed query."""
+    conn = _db_conn(str(db_path))
+    row = conn.execute(
+        """
+        SELECT
+          mv.version_id, mv.model_id, mv.run_id, mv.artifact_path, mv.parent_version_id,
+          tr.run_id AS tr_run_id, tr.student_model_id, tr.teacher_model_id, tr.base_version_id,
+          mv_base.artifact_path AS base_artifact_path,
+          m.default_artifact_path AS student_default_artifact_path
+        FROM model_versions mv
+        LEFT JOIN training_runs tr ON tr.run_id = mv.run_id
+        LEFT JOIN model_versions mv_base ON mv_base.version_id = tr.base_version_id
+        LEFT JOIN models m ON m.model_id = tr.student_model_id
+        WHERE mv.version_id = ?
+        """,
+        (version_id,),
+    ).fetchone()
+    if not row:
+        raise ValueError(f"Model version not found: {version_id}")
+
+    version = DbVersionInfo(
+        version_id=str(row["version_id"]),
+        model_id=str(row["model_id"]),
+        run_id=(str(row["run_id"]) if row["run_id"] is not None else None),
+        artifact_path=str(row["artifact_path"]),
+        parent_version_id=(
+            str(row["parent_version_id"]) if row["parent_version_id"] is not None else None
+        ),
+    )
 
-def _load_run_info(db_path: Path, run_id: str) -> Optional[DbRunInfo]:
-    conn = sqlite3.connect(str(db_path))
-    conn.row_factory = sqlite3.Row
-    try:
-        row = conn.execute(
-            """
-            SELECT run_id, student_model_id, teacher_model_id, base_version_id
-            FROM training_runs
-            WHERE run_id = ?
-            """,
-            (run_id,),
-        ).fetchone()
-        if not row:
-            return None
-        return DbRunInfo(
-            run_id=str(row["run_id"]),
+    run: Optional[DbRunInfo] = None
+    if row["tr_run_id"] is not None:
+        run = DbRunInfo(
+            run_id=str(row["tr_run_id"]),
             student_model_id=(str(row["student_model_id"]) if row["student_model_id"] is not None else None),
             teacher_model_id=(str(row["teacher_model_id"]) if row["teacher_model_id"] is not None else None),
             base_version_id=(str(row["base_version_id"]) if row["base_version_id"] is not None else None),
         )
-    finally:
-        conn.close()
 
+    base_model_path: Optional[str] = None
+    if row["base_artifact_path"]:
+        base_model_path = str(row["base_artifact_path"])
+    elif row["student_default_artifact_path"]:
+        base_model_path = str(row["student_default_artifact_path"])
 
-def _resolve_model_artifact_path(
-    db_path: Path, model_id: str, base_version_id: Optional[str]
-) -> Optional[str]:
-    conn = sqlite3.connect(str(db_path))
-    conn.row_factory = sqlite3.Row
-    try:
-        if base_version_id:
-            row = conn.execute(
-                "SELECT artifact_path FROM model_versions WHERE version_id = ?",
-                (base_version_id,),
-            ).fetchone()
-            if row and row["artifact_path"]:
-                return str(row["artifact_path"])
-
-        row = conn.execute(
-            "SELECT default_artifact_path FROM models WHERE model_id = ?",
-            (model_id,),
-        ).fetchone()
-        if row and row["default_artifact_path"]:
-            return str(row["default_artifact_path"])
-        return None
-    finally:
-        conn.close()
+    return DbEvalContext(version=version, run=run, base_model_path=base_model_path)
 
 
-def _resolve_teacher_source(db_path: Path, teacher_model_id: str) -> Dict[str, Any]:
-    conn = sqlite3.connect(str(db_path))
-    conn.row_factory = sqlite3.Row
-    try:
-        row = conn.execute(
-            "SELECT provider, default_artifact_path FROM models WHERE model_id = ?",
-            (teacher_model_id,),
-        ).fetchone()
-        if not row:
-            return {"kind": "missing", "model_id": teacher_model_id}
+def _resolve_model_sources(db_path: Path, model_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Resolve any number of model ids in a single IN (...) query.
 
+    Returns a dict keyed by model_id; ids missing from the models table get a
+    {"kind": "missing"} entry.
+    """
+    out: Dict[str, Dict[str, Any]] = {
+        model_id: {"kind": "missing", "model_id": model_id} for model_id in model_ids
+    }
+    if not model_ids:
+        return out
+
+    conn = _db_conn(str(db_path))
+    placeholders = ",".join("?" * len(model_ids))
+    rows = conn.execute(
+        f"SELECT model_id, provider, default_artifact_path FROM models WHERE model_id IN ({placeholders})",
+        model_ids,
+    ).fetchall()
+    for row in rows:
+        model_id = str(row["model_id"])
         provider = str(row["provider"])
         if provider == "local":
-            return {
+            out[model_id] = {
                 "kind": "local",
-                "model_id": teacher_model_id,
-                "artifact_path": (str(row["default_artifact_path"]) if row["default_artifact_path"] else None),
+                "model_id": model_id,
+                "artifact_path": (
+                    str(row["default_artifact_path"]) if row["default_artifact_path"] else None
+                ),
             }
-        return {"kind": "api", "model_id": teacher_model_id}
-    finally:
-        conn.close()
+        else:
+            out[model_id] = {"kind": "api", "model_id": model_id}
+    return out
 
 
-def _load_dataset_items(db_path: Path, dataset_id: str) -> List[EvalSample]:
-    conn = sqlite3.connect(str(db_path))
-    conn.row_factory = sqlite3.Row
-    try:
-        rows = conn.execute(
-            """
-            SELECT prompt, expected_output, metadata_json
-            FROM dataset_items
-            WHERE dataset_id = ?
-            ORDER BY created_at ASC, item_id ASC
-            """,
-            (dataset_id,),
-        ).fetchall()
-        samples: List[EvalSample] = []
+def _resolve_teacher_source(db_path: Path, teacher_model_id: str) -> Dict[str, Any]:
+    return _resolve_model_sources(db_path, [teacher_model_id])[teacher_model_id]
+
+
+def _iter_dataset_items(
+    db_path: Path, dataset_id: str, limit: Optional[int] = None
+) -> Iterator[EvalSample]:
+    """Yield dataset items incrementally instead of materializing every row.
+
+    When `limit` is set it is pushed down into the SQL so discarded rows are
+    never fetched at all.
+    """
+    conn = _db_conn(str(db_path))
+    sql = """
+        SELECT prompt, expected_output, metadata_json
+        FROM dataset_items
+        WHERE dataset_id = ?
+        ORDER BY created_at ASC, item_id ASC
+    """
+    params: List[Any] = [dataset_id]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    cur = conn.execute(sql, params)
+    while True:
+        rows = cur.fetchmany(1024)
+        if not rows:
+            break
         for r in rows:
             prompt = str(r["prompt"] or "")
             expected = str(r["expected_output"] or "")
@@ -325,10 +433,20 @@ def _load_dataset_items(db_path: Path, dataset_id: str) -> List[EvalSample]:
                 except Exception:
                     meta = None
             if prompt and expected:
-                samples.append(EvalSample(prompt=prompt, expected=expected, metadata=meta))
-        return samples
-    finally:
-        conn.close()
+                keywords_lower: Tuple[str, ...] = ()
+                citations_lower: Tuple[str, ...] = ()
+                if meta:
+                    if isinstance(meta.get("keywords"), list):
+                        keywords_lower = tuple(str(k).lower() for k in meta["keywords"])
+                    if isinstance(meta.get("citations"), list):
+                        citations_lower = tuple(str(c).lower() for c in meta["citations"])
+                yield EvalSample(
+                    prompt=prompt,
+                    expected=expected,
+                    expected_norm=_normalize_text(expected),
+                    keywords_lower=keywords_lower,
+                    citations_lower=citations_lower,
+                )
 
 
 def _is_adapter_dir(path: Path) -> bool:
@@ -343,21 +461,24 @@ def _normalize_text(text: str) -> str:
     return " ".join(text.strip().lower().split())
 
 
+def _fuzzy_ratio(a: str, b: str) -> float:
+    if _rapidfuzz is not None:
+        return _rapidfuzz.ratio(a, b) / 100.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
 def _tokenize(text: str) -> List[str]:
     """Simple word tokenization for metric computation."""
     return text.strip().lower().split()
 
 
-def _compute_bleu(prediction: str, reference: str) -> float:
+def _compute_bleu_tokens(pred_tokens: List[str], ref_tokens: List[str]) -> float:
     """
-    Compute sentence-level BLEU score (BLEU-4 with smoothing).
+    Compute sentence-level BLEU score (BLEU-4 with smoothing) on pre-tokenized text.
 
     Uses a simple n-gram based approach without external dependencies.
     Falls back to nltk if available for better accuracy.
     """
-    pred_tokens = _tokenize(prediction)
-    ref_tokens = _tokenize(reference)
-
     if not pred_tokens or not ref_tokens:
         return 0.0
 
@@ -371,24 +492,17 @@ def _compute_bleu(prediction: str, reference: str) -> float:
         pass
 
     # Fallback: simple n-gram based BLEU approximation
-    from collections import Counter
-    import math
-
-    def ngram_counts(tokens: List[str], n: int) -> Counter:
-        return Counter(tuple(tokens[i:i+n]) for i in range(len(tokens) - n + 1))
-
-    # Calculate n-gram precisions for n=1,2,3,4
+    # Calculate n-gram precisions for n=1,2,3,4. Counter intersection (&)
+    # does the clipped-count min() in C.
     precisions = []
     for n in range(1, 5):
-        pred_ngrams = ngram_counts(pred_tokens, n)
-        ref_ngrams = ngram_counts(ref_tokens, n)
-
-        if not pred_ngrams:
+        total = len(pred_tokens) - n + 1
+        if total <= 0:
             precisions.append(0.0)
             continue
-
-        clipped = sum(min(pred_ngrams[ng], ref_ngrams.get(ng, 0)) for ng in pred_ngrams)
-        total = sum(pred_ngrams.values())
+        pred_ngrams = Counter(zip(*(pred_tokens[i:] for i in range(n))))
+        ref_ngrams = Counter(zip(*(ref_tokens[i:] for i in range(n))))
+        clipped = sum((pred_ngrams & ref_ngrams).values())
 
         # Smoothing: add 1 to avoid zero
         precisions.append((clipped + 1) / (total + 1))
@@ -408,48 +522,59 @@ def _compute_bleu(prediction: str, reference: str) -> float:
     return bp * math.exp(avg_log_precision) if avg_log_precision > float('-inf') else 0.0
 
 
-def _compute_f1(prediction: str, reference: str) -> float:
+def _compute_f1_tokens(pred_tokens: List[str], ref_tokens: List[str]) -> float:
     """
-    Compute token-level F1 score between prediction and reference.
+    Compute token-level F1 score between pre-tokenized prediction and reference.
 
     This measures the overlap between the predicted and reference tokens,
     useful for evaluating partial correctness.
     """
-    pred_tokens = set(_tokenize(prediction))
-    ref_tokens = set(_tokenize(reference))
+    pred_set = set(pred_tokens)
+    ref_set = set(ref_tokens)
 
-    if not pred_tokens or not ref_tokens:
+    if not pred_set or not ref_set:
         return 0.0
 
-    common = pred_tokens & ref_tokens
+    common = pred_set & ref_set
 
     if not common:
         return 0.0
 
-    precision = len(common) / len(pred_tokens)
-    recall = len(common) / len(ref_tokens)
+    precision = len(common) / len(pred_set)
+    recall = len(common) / len(ref_set)
 
     return 2 * precision * recall / (precision + recall)
 
 
-def _compute_faithfulness(prediction: str, keywords: List[str]) -> float:
+def _count_pattern_hits(text: str, patterns: Tuple[str, ...]) -> int:
+    """Number of distinct patterns that occur as substrings of `text`.
+
+    With many patterns a single Aho-Corasick scan beats the per-pattern
+    `in` loop; below the threshold (or without the dependency) the plain
+    loop is cheaper.
+    """
+    if ahocorasick is not None and len(patterns) >= 8:
+        automaton = ahocorasick.Automaton()
+        for i, p in enumerate(patterns):
+            if p:
+                automaton.add_word(p, i)
+        automaton.make_automaton()
+        return len({i for _, i in automaton.iter(text)})
+    return sum(1 for p in patterns if p in text)
+
+
+def _compute_faithfulness(prediction: str, keywords: Tuple[str, ...]) -> float:
     """
     Compute faithfulness score based on keyword coverage.
 
     Measures what fraction of required keywords appear in the prediction.
+    Keywords are expected to be pre-lowercased.
     """
     if not keywords:
         return 1.0  # No keywords to check
 
     pred_lower = prediction.lower()
-    hits = sum(1 for kw in keywords if kw.lower() in pred_lower)
-    return hits / len(keywords)
-
-
-def _strip_prompt(prompt: str, output: str) -> str:
-    if output.startswith(prompt):
-        return output[len(prompt):].strip()
-    return output.strip()
+    return _count_pattern_hits(pred_lower, keywords) / len(keywords)
 
 
 def _set_seed(seed: Optional[int]) -> None:
@@ -474,7 +599,7 @@ def _set_seed(seed: Optional[int]) -> None:
 
 
 def _load_student_and_teacher(
-    cfg: EvalConfig, db_path: Path, version: DbVersionInfo
+    cfg: EvalConfig, db_path: Path, ctx: DbEvalContext
 ) -> Tuple[Any, Any, Optional[Any]]:
     import torch  # type: ignore
     from transformers import AutoModelForCausalLM, AutoTokenizer  # type: ignore
@@ -484,26 +609,28 @@ def _load_student_and_teacher(
     except Exception:
         PeftModel = None  # type: ignore
 
-    artifact_path = Path(version.artifact_path)
+    artifact_path = Path(ctx.version.artifact_path)
     if _is_gguf(artifact_path):
         raise RuntimeError("GGUF artifacts are not supported for evaluation in this runner.")
 
-    run_info = _load_run_info(db_path, version.run_id) if version.run_id else None
-    base_model_path: Optional[str] = None
-    if run_info and run_info.student_model_id:
-        base_model_path = _resolve_model_artifact_path(
-            db_path, run_info.student_model_id, run_info.base_version_id
+    # Half precision + SDPA halve the per-token memory traffic on GPU; keep
+    # fp32 defaults on CPU where half precision is slower.
+    model_kwargs: Dict[str, Any] = {"local_files_only": True}
+    if torch.cuda.is_available():
+        model_kwargs["torch_dtype"] = (
+            torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
         )
+        model_kwargs["attn_implementation"] = "sdpa"
+
+    run_info = ctx.run
+    base_model_path = ctx.base_model_path
 
     if artifact_path.is_dir() and _is_adapter_dir(artifact_path):
         if not base_model_path:
             raise RuntimeError("Adapter artifact requires a base model path.")
         if PeftModel is None:
             raise RuntimeError("peft is required to load adapter artifacts.")
-        base_model = AutoModelForCausalLM.from_pretrained(
-            base_model_path,
-            local_files_only=True,
-        )
+        base_model = AutoModelForCausalLM.from_pretrained(base_model_path, **model_kwargs)
         tokenizer = AutoTokenizer.from_pretrained(
             base_model_path,
             local_files_only=True,
@@ -516,17 +643,41 @@ def _load_student_and_teacher(
             local_files_only=True,
             use_fast=True,
         )
-        model = AutoModelForCausalLM.from_pretrained(
-            str(artifact_path),
-            local_files_only=True,
-        )
+        model = AutoModelForCausalLM.from_pretrained(str(artifact_path), **model_kwargs)
 
     if tokenizer.pad_token_id is None and tokenizer.eos_token_id is not None:
         tokenizer.pad_token_id = tokenizer.eos_token_id
+    # Configure batching behavior once here rather than per generate call:
+    # causal LMs need left padding so the continuation is contiguous, and
+    # left truncation keeps the end of over-long prompts.
+    tokenizer.padding_side = "left"
+    tokenizer.truncation_side = "left"
 
     device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
     model.to(device)
     model.eval()
+    if getattr(model, "generation_config", None) is not None:
+        model.generation_config.use_cache = True
+
+    if cfg.compile_model and hasattr(torch, "compile"):
+        try:
+            model = torch.compile(model, mode="reduce-overhead", fullgraph=False)
+            # Warm up once so the compile cost is not attributed to the first
+            # evaluated sample.
+            warmup = tokenizer("warmup", return_tensors="pt")
+            warmup = {k: v.to(device) for k, v in warmup.items()}
+            with torch.inference_mode():
+                model.generate(
+                    **warmup,
+                    max_new_tokens=1,
+                    do_sample=False,
+                    pad_token_id=tokenizer.pad_token_id,
+                )
+        except Exception:
+            _jsonl(
+                "status",
+                {"level": "warn", "message": "torch.compile failed; continuing in eager mode"},
+            )
 
     teacher_model = None
     if cfg.compute_teacher_agreement and run_info and run_info.teacher_model_id:
@@ -534,12 +685,11 @@ def _load_student_and_teacher(
         if teacher_src.get("kind") == "local" and teacher_src.get("artifact_path"):
             teacher_path = str(teacher_src["artifact_path"])
             if not _is_gguf(Path(teacher_path)):
-                teacher_model = AutoModelForCausalLM.from_pretrained(
-                    teacher_path,
-                    local_files_only=True,
-                )
+                teacher_model = AutoModelForCausalLM.from_pretrained(teacher_path, **model_kwargs)
                 teacher_model.to(device)
                 teacher_model.eval()
+                if getattr(teacher_model, "generation_config", None) is not None:
+                    teacher_model.generation_config.use_cache = True
         elif teacher_src.get("kind") == "api":
             _jsonl(
                 "status",
@@ -553,38 +703,180 @@ def _load_student_and_teacher(
     return tokenizer, model, teacher_model
 
 
-def _generate(
+def _common_token_prefix(
+    tokenizer: Any, prompts: List[str], min_tokens: int = 8
+) -> Optional[List[int]]:
+    """Longest common token prefix shared by all prompts, or None if too short."""
+    if len(prompts) < 2:
+        return None
+    encoded = [tokenizer.encode(p, add_special_tokens=True) for p in prompts]
+    first = encoded[0]
+    # Leave at least one token per prompt as a generation suffix.
+    limit = min(len(ids) for ids in encoded) - 1
+    n = 0
+    while n < limit and all(ids[n] == first[n] for ids in encoded):
+        n += 1
+    if n < min_tokens:
+        return None
+    return first[:n]
+
+
+def _encode_prompts(tokenizer: Any, prompts: List[str], prompt_max_len: int) -> Dict[str, Any]:
+    """Tokenize a batch of prompts once, on CPU, so both student and teacher
+    generation can share the encoding.
+
+    Caps prompt length explicitly; truncation without max_length falls back
+    to the model's full positional window and inflates prefill cost.
+    """
+    return dict(
+        tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=prompt_max_len,
+        )
+    )
+
+
+def _prefill_prefix(model: Any, prefix_ids: List[int]) -> Optional[Dict[str, Any]]:
+    """Run the shared prompt prefix through the model once and keep its KV cache."""
+    import torch  # type: ignore
+
+    try:
+        ids = torch.tensor([prefix_ids], dtype=torch.long, device=model.device)
+        with torch.inference_mode():
+            out = model(input_ids=ids, use_cache=True)
+        pkv = out.past_key_values
+        if hasattr(pkv, "to_legacy_cache"):
+            pkv = pkv.to_legacy_cache()
+        return {"ids": prefix_ids, "pkv": pkv}
+    except Exception:
+        return None
+
+
+def _generate_batch(
     tokenizer: Any,
     model: Any,
-    prompt: str,
+    prompts: List[str],
     max_new_tokens: int,
     temperature: float,
     top_p: float,
-) -> str:
+    prompt_max_len: int = 1024,
+    prefix: Optional[Dict[str, Any]] = None,
+    encoded: Optional[Dict[str, Any]] = None,
+) -> List[str]:
     import torch  # type: ignore
 
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True)
-    inputs = {k: v.to(model.device) for k, v in inputs.items()}
+    batch = len(prompts)
+    past_key_values = None
+    if prefix is not None:
+        # Reuse the prefilled KV cache for the shared prefix: feed only the
+        # per-prompt suffixes (left-padded) and expand the cached prefix KV
+        # across the batch. Falls back to full-prompt generation on mismatch.
+        try:
+            prefix_ids = prefix["ids"]
+            plen = len(prefix_ids)
+            # Keep `encoded` (the pre-batched tensors) untouched: the
+            # fallback below still needs it if the prefix check fails.
+            prompt_ids = [tokenizer.encode(p, add_special_tokens=True) for p in prompts]
+            if all(ids[:plen] == prefix_ids and len(ids) > plen for ids in prompt_ids):
+                suffixes = [ids[plen:] for ids in prompt_ids]
+                max_suffix = max(len(s) for s in suffixes)
+                pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+                rows = [[pad_id] * (max_suffix - len(s)) + s for s in suffixes]
+                # Mask covers past (prefix) + new tokens: pads sit between them.
+                masks = [
+                    [1] * plen + [0] * (max_suffix - len(s)) + [1] * len(s)
+                    for s in suffixes
+                ]
+                inputs = {
+                    "input_ids": torch.tensor(rows, dtype=torch.long, device=model.device),
+                    "attention_mask": torch.tensor(masks, dtype=torch.long, device=model.device),
+                }
+                expanded = tuple(
+                    (k.expand(batch, *k.shape[1:]), v.expand(batch, *v.shape[1:]))
+                    for k, v in prefix["pkv"]
+                )
+                try:
+                    from transformers import DynamicCache  # type: ignore
+
+                    past_key_values = DynamicCache.from_legacy_cache(expanded)
+                except Exception:
+                    past_key_values = expanded
+        except Exception:
+            past_key_values = None
+
+    if past_key_values is None:
+        if encoded is None:
+            encoded = _encode_prompts(tokenizer, prompts, prompt_max_len)
+        if model.device.type == "cuda":
+            # Pinned staging buffers let the H2D copy run async instead of
+            # stalling on pageable memory.
+            inputs = {
+                k: v.pin_memory().to(model.device, non_blocking=True)
+                for k, v in encoded.items()
+            }
+        else:
+            inputs = {k: v.to(model.device) for k, v in encoded.items()}
+    input_len = inputs["input_ids"].shape[1]
 
     do_sample = temperature > 0
-    gen_kwargs: Dict[str, Any] = {
-        "max_new_tokens": max_new_tokens,
-        "do_sample": do_sample,
-        "pad_token_id": tokenizer.pad_token_id,
-        "eos_token_id": tokenizer.eos_token_id,
-    }
+    gen_kwargs: Dict[str, Any] = {}
     if do_sample:
-        gen_kwargs["temperature"] = temperature
-        gen_kwargs["top_p"] = top_p
+        gen_kwargs.update(
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=temperature,
+            top_p=top_p,
+            use_cache=True,
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+        )
+    else:
+        # A fully-specified GenerationConfig bypasses the default merge with
+        # the model's generation_config, so greedy decoding runs with no
+        # sampling warpers or logits processors attached.
+        from transformers import GenerationConfig  # type: ignore
+
+        gen_kwargs["generation_config"] = GenerationConfig(
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            num_beams=1,
+            temperature=1.0,
+            top_p=1.0,
+            top_k=0,
+            repetition_penalty=1.0,
+            use_cache=True,
+            pad_token_id=tokenizer.pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+        )
+    if past_key_values is not None:
+        gen_kwargs["past_key_values"] = past_key_values
 
-    with torch.no_grad():
+    if model.device.type == "cuda":
+        autocast_ctx = torch.autocast(
+            device_type="cuda",
+            dtype=torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16,
+        )
+    else:
+        autocast_ctx = contextlib.nullcontext()
+
+    with torch.inference_mode(), autocast_ctx:
         output_ids = model.generate(**inputs, **gen_kwargs)
-    decoded = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-    return _strip_prompt(prompt, decoded)
+    new_ids = output_ids[:, input_len:]
+    return [
+        tokenizer.decode(row, skip_special_tokens=True).strip()
+        for row in new_ids
+    ]
 
 
 def _evaluate(
-    cfg: EvalConfig, raw: Dict[str, Any], run_dir: Path, samples: List[EvalSample]
+    cfg: EvalConfig,
+    raw: Dict[str, Any],
+    run_dir: Path,
+    samples: SamplesSoA,
+    flush_every: int = 16,
 ) -> None:
     imports = _try_imports()
     if not imports.get("transformers") or not imports.get("torch"):
@@ -596,14 +888,14 @@ def _evaluate(
     if not db_path:
         raise RuntimeError("training_db_path not provided and could not infer")
 
-    version = _load_version_info(db_path, cfg.version_id)
-    tokenizer, model, teacher_model = _load_student_and_teacher(cfg, db_path, version)
+    ctx = _load_eval_context(db_path, cfg.version_id)
+    tokenizer, model, teacher_model = _load_student_and_teacher(cfg, db_path, ctx)
 
     if cfg.max_samples is not None and len(samples) > cfg.max_samples:
         rng = random.Random(cfg.seed or 0)
-        samples = samples[:]
-        rng.shuffle(samples)
-        samples = samples[: cfg.max_samples]
+        order = list(range(len(samples)))
+        rng.shuffle(order)
+        samples = samples.select(order[: cfg.max_samples])
 
     total = len(samples)
     if total == 0:
@@ -620,85 +912,105 @@ def _evaluate(
     faithfulness_count = 0
     teacher_agree = 0
 
-    predictions: List[Dict[str, Any]] = []
+    # Stream predictions to the tmp file as they are produced instead of
+    # holding them all in memory; os.replace keeps the final write atomic.
+    predictions_path = run_dir / "predictions.jsonl"
+    predictions_path.parent.mkdir(parents=True, exist_ok=True)
+    predictions_tmp = predictions_path.with_suffix(
+        predictions_path.suffix + f".tmp-{int(time.time()*1000)}"
+    )
+    predictions_file = predictions_tmp.open("wb")
 
-    for idx, sample in enumerate(samples, start=1):
-        pred = _generate(
-            tokenizer,
-            model,
-            sample.prompt,
-            cfg.max_new_tokens,
-            cfg.temperature,
-            cfg.top_p,
-        )
-        pred_norm = _normalize_text(pred)
-        exp_norm = _normalize_text(sample.expected)
-
-        # Exact match
-        exact = 1 if pred_norm == exp_norm else 0
-        exact_matches += exact
-
-        # Fuzzy match (sequence matcher)
-        from difflib import SequenceMatcher
-        fuzzy = SequenceMatcher(None, pred_norm, exp_norm).ratio()
-        fuzzy_total += fuzzy
-
-        # BLEU score
-        bleu = _compute_bleu(pred, sample.expected)
-        bleu_total += bleu
-
-        # F1 score (token overlap)
-        f1 = _compute_f1(pred, sample.expected)
-        f1_total += f1
-
-        # Citation coverage (if metadata has citations)
-        coverage = None
-        if sample.metadata and isinstance(sample.metadata.get("citations"), list):
-            citations = [str(c) for c in sample.metadata.get("citations") or []]
-            if citations:
-                hits = sum(1 for c in citations if c.lower() in pred_norm)
-                coverage = hits / max(1, len(citations))
+    # Prompts often share a fixed instruction prefix; prefill its KV once so
+    # each batch only computes attention over the per-sample suffix.
+    student_prefix: Optional[Dict[str, Any]] = None
+    teacher_prefix: Optional[Dict[str, Any]] = None
+    try:
+        prefix_ids = _common_token_prefix(tokenizer, samples.prompts)
+    except Exception:
+        prefix_ids = None
+    if prefix_ids:
+        student_prefix = _prefill_prefix(model, prefix_ids)
+        if teacher_model is not None:
+            teacher_prefix = _prefill_prefix(teacher_model, prefix_ids)
+
+    batch_size = max(1, cfg.batch_size)
+    idx = 0
+
+    def _score_chunk(
+        start: int, preds: List[str], teacher_preds: Optional[List[str]]
+    ) -> None:
+        nonlocal idx, exact_matches, fuzzy_total, bleu_total, f1_total
+        nonlocal coverage_total, coverage_count, faithfulness_total, faithfulness_count
+        nonlocal teacher_agree
+
+        for pos, pred in enumerate(preds):
+            i = start + pos
+            idx += 1
+            pred_norm = _normalize_text(pred)
+            exp_norm = samples.expected_norm[i]
+
+            # Exact match
+            exact = 1 if pred_norm == exp_norm else 0
+            exact_matches += exact
+
+            # Fuzzy match (rapidfuzz when available, sequence matcher otherwise)
+            fuzzy = _fuzzy_ratio(pred_norm, exp_norm)
+            fuzzy_total += fuzzy
+
+            # Tokenize once; BLEU and F1 share the token lists.
+            pred_tokens = _tokenize(pred)
+            exp_tokens = _tokenize(samples.expected[i])
+
+            # BLEU score
+            bleu = _compute_bleu_tokens(pred_tokens, exp_tokens)
+            bleu_total += bleu
+
+            # F1 score (token overlap)
+            f1 = _compute_f1_tokens(pred_tokens, exp_tokens)
+            f1_total += f1
+
+            # Citation coverage (if metadata has citations)
+            coverage = None
+            citations_lower = samples.citations_lower[i]
+            if citations_lower:
+                hits = _count_pattern_hits(pred_norm, citations_lower)
+                coverage = hits / len(citations_lower)
                 coverage_total += coverage
                 coverage_count += 1
 
-        # Faithfulness (if metadata has keywords)
-        faithfulness = None
-        if sample.metadata and isinstance(sample.metadata.get("keywords"), list):
-            keywords = [str(k) for k in sample.metadata.get("keywords") or []]
-            if keywords:
-                faithfulness = _compute_faithfulness(pred, keywords)
+            # Faithfulness (if metadata has keywords)
+            faithfulness = None
+            keywords_lower = samples.keywords_lower[i]
+            if keywords_lower:
+                faithfulness = _compute_faithfulness(pred, keywords_lower)
                 faithfulness_total += faithfulness
                 faithfulness_count += 1
 
-        # Teacher agreement (if teacher model is available)
-        if teacher_model is not None:
-            teacher_out = _generate(
-                tokenizer,
-                teacher_model,
-                sample.prompt,
-                cfg.max_new_tokens,
-                cfg.temperature,
-                cfg.top_p,
+            # Teacher agreement (if teacher model is available)
+            if teacher_preds is not None:
+                teacher_norm = _normalize_text(teacher_preds[pos])
+                if teacher_norm == pred_norm:
+                    teacher_agree += 1
+
+            predictions_file.write(
+                _dumps_bytes(
+                    {
+                        "prompt": samples.prompts[i],
+                        "expected": samples.expected[i],
+                        "predicted": pred,
+                        "exact_match": exact,
+                        "fuzzy_match": fuzzy,
+                        "bleu": bleu,
+                        "f1": f1,
+                        "citation_coverage": coverage,
+                        "faithfulness": faithfulness,
+                    }
+                )
+                + b"\n"
             )
-            teacher_norm = _normalize_text(teacher_out)
-            if teacher_norm == pred_norm:
-                teacher_agree += 1
-
-        predictions.append(
-            {
-                "prompt": sample.prompt,
-                "expected": sample.expected,
-                "predicted": pred,
-                "exact_match": exact,
-                "fuzzy_match": fuzzy,
-                "bleu": bleu,
-                "f1": f1,
-                "citation_coverage": coverage,
-                "faithfulness": faithfulness,
-            }
-        )
 
-        _jsonl(
+        _jsonl_buffered(
             "progress",
             {
                 "eval_id": cfg.eval_id,
@@ -709,8 +1021,59 @@ def _evaluate(
                 "bleu": bleu_total / idx,
                 "f1": f1_total / idx,
             },
+            flush_every,
         )
 
+    # Score each batch on a background thread while the GPU generates the
+    # next one; a single worker keeps the accumulator updates serialized.
+    executor = ThreadPoolExecutor(max_workers=1)
+    score_futures: List[Any] = []
+    try:
+        for start in range(0, total, batch_size):
+            prompts = samples.prompts[start : start + batch_size]
+
+            # Student and teacher share one tokenizer, so encode the chunk once
+            # and reuse the result for both generate calls (the prefix-cache path
+            # carries its own suffix encoding).
+            chunk_encoded: Optional[Dict[str, Any]] = None
+            if student_prefix is None:
+                chunk_encoded = _encode_prompts(tokenizer, prompts, cfg.prompt_max_len)
+
+            preds = _generate_batch(
+                tokenizer,
+                model,
+                prompts,
+                cfg.max_new_tokens,
+                cfg.temperature,
+                cfg.top_p,
+                prompt_max_len=cfg.prompt_max_len,
+                prefix=student_prefix,
+                encoded=chunk_encoded,
+            )
+
+            teacher_preds: Optional[List[str]] = None
+            if teacher_model is not None:
+                teacher_preds = _generate_batch(
+                    tokenizer,
+                    teacher_model,
+                    prompts,
+                    cfg.max_new_tokens,
+                    cfg.temperature,
+                    cfg.top_p,
+                    prompt_max_len=cfg.prompt_max_len,
+                    prefix=teacher_prefix,
+                    encoded=chunk_encoded if teacher_prefix is None else None,
+                )
+
+            score_futures.append(executor.submit(_score_chunk, start, preds, teacher_preds))
+
+        for fut in score_futures:
+            fut.result()
+    finally:
+        executor.shutdown(wait=True)
+
+    _flush_buffered()
+
     # Compute final metrics
     exact_rate = exact_matches / total
     fuzzy_avg = fuzzy_total / total
@@ -733,8 +1096,8 @@ def _evaluate(
     if teacher_model is not None:
         metrics["teacher_agreement"] = teacher_agree / total
 
-    predictions_path = run_dir / "predictions.jsonl"
-    _atomic_write_jsonl(predictions_path, predictions)
+    predictions_file.close()
+    os.replace(predictions_tmp, predictions_path)
 
     metrics_path = run_dir / "metrics.json"
     _atomic_write_text(metrics_path, json.dumps(metrics, indent=2, ensure_ascii=True))
@@ -751,6 +1114,12 @@ def main() -> int:
     parser.add_argument("--config", help="Path to JSON config")
     parser.add_argument("--stdin", action="store_true", help="Read JSON config from stdin")
     parser.add_argument("--run-dir", help="Override run_dir in config")
+    parser.add_argument(
+        "--flush-every",
+        type=int,
+        default=16,
+        help="Flush buffered progress events every N batches",
+    )
     args = parser.parse_args()
 
     raw: Dict[str, Any] = {}
@@ -792,13 +1161,18 @@ def main() -> int:
         if not db_path:
             raise RuntimeError("training_db_path not provided and could not infer")
 
-        samples = _load_dataset_items(db_path, cfg.dataset_id)
+        # With no shuffle seed, max_samples can be applied as a LIMIT so the
+        # rest of the dataset is never pulled out of SQLite.
+        limit: Optional[int] = None
+        if cfg.max_samples is not None and cfg.seed is None:
+            limit = cfg.max_samples
+        samples = _build_samples_soa(_iter_dataset_items(db_path, cfg.dataset_id, limit=limit))
         _jsonl(
             "dataset",
             {"eval_id": cfg.eval_id, "total": len(samples), "dataset_id": cfg.dataset_id},
         )
 
-        _evaluate(cfg, raw, run_dir, samples)
+        _evaluate(cfg, raw, run_dir, samples, flush_every=max(1, args.flush_every))
 
         _jsonl(
             "status",